@@ -1,8 +1,22 @@
 import requests
 import zipfile
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import io
 import argparse
+import functools
+import json
+import os
 import pandas
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+# local file header signature that every zip archive starts with
+ZIP_MAGIC = b"PK\x03\x04"
+
+# sidecar file in the output directory holding the HTTP cache validators of each archive
+HTTP_CACHE_FILE_NAME = ".qst_http_cache.json"
 
 
 # usage: quellensteuer.py [-d OUTPUT_DIR]
@@ -15,43 +29,147 @@ def parse_args():
 
 
 # Source: https://www.estv.admin.ch/estv/de/home/direkte-bundessteuer/dbst-quellensteuer/qst-tarife-kantone.html
+@functools.cache
 def get_qlt_zip_url_pre_2024(year: int) -> str:
     return f"https://www.estv.admin.ch/dam/estv/de/dokumente/qst/schweiz/qst-ch-tar{year}-de.zip.download.zip/qst-ch-tar{year}-de.zip"
 
+@functools.cache
 def get_qlt_zip_url_from_2024(year: int) -> str:
     return f"https://www.estv.admin.ch/dam/estv/de/dokumente/qst/schweiz/tar{year}.zip.download.zip/tar{year}.zip"
 
+# download URL of the tax tables for each year
+YEAR_TO_URL = {
+    2021: get_qlt_zip_url_pre_2024(2021),
+    2022: get_qlt_zip_url_pre_2024(2022),
+    2023: get_qlt_zip_url_pre_2024(2023),
+    2024: get_qlt_zip_url_from_2024(2024),
+}
+
+def extract_zip(z: zipfile.ZipFile, output_dir: str) -> list:
+    """
+    Extracts the files of `z` into `output_dir`, copying them with a 1 MiB buffer.
+    Returns the names of the extracted files.
+    """
+    output_dir = os.path.abspath(output_dir)
+    files = []
+    for info in z.infolist():
+        target = os.path.abspath(os.path.join(output_dir, info.filename))
+        # error if a file would be extracted outside of the output directory
+        if os.path.commonpath([output_dir, target]) != output_dir:
+            raise Exception(f"Unexpected file path in archive: {info.filename}")
+        if info.is_dir():
+            os.makedirs(target, exist_ok=True)
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with z.open(info) as src, open(target, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        files.append(info.filename)
+    return files
+
+def fetch(url: str, session: requests.Session, output_dir: str, cached: dict) -> dict:
+    """
+    Downloads and extracts the archive at `url` unless it is unchanged since the
+    previous download, as described by its `cached` HTTP cache entry.
+    Returns the cache entry to store for the archive.
+    """
+    zip_name = url.rsplit("/", 1)[-1] # get the last part of the url
+
+    # only revalidate if the previously extracted files are still present
+    headers = {}
+    if cached and all(
+        os.path.exists(os.path.join(output_dir, name)) for name in cached["files"]
+    ):
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    print(f"Downloading {zip_name}.")
+    # the response is closed on every path, including errors while extracting
+    with session.get(url, headers=headers, stream=True, timeout=(10, 60)) as r:
+        if r.status_code == 304:
+            print(f"{zip_name} is unchanged.")
+            return cached
+        r.raise_for_status()
+
+        files = []
+        # spool the response body (to disk once it exceeds 8 MiB) rather than buffering it twice in memory
+        with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as tmp:
+            # only decodes if the server ignored the identity encoding request
+            r.raw.decode_content = True
+            shutil.copyfileobj(r.raw, tmp, 1024 * 1024)
+            tmp.seek(0)
+
+            print(f"Extracting {zip_name}.")
+            with zipfile.ZipFile(tmp) as z:
+                # error if a file within the zip file is not also a zip file
+                # (checked for all files before extracting any of them)
+                for f in z.infolist():
+                    with z.open(f) as nested_file:
+                        if nested_file.read(4) != ZIP_MAGIC:
+                            raise Exception(f"Unexpected contents of {zip_name}.")
+                # iterate through file list of the parent zip file and extract the nested zips
+                # (each nested zip is read once into a seekable buffer)
+                for f in z.infolist():
+                    with zipfile.ZipFile(io.BytesIO(z.read(f))) as nested_zip:
+                        files.extend(extract_zip(nested_zip, output_dir))
+
+        return {
+            "etag": r.headers.get("ETag"),
+            "last_modified": r.headers.get("Last-Modified"),
+            "files": files,
+        }
+
 def main():
     args = parse_args()
 
-    year_format_mapping = {
-        2021: get_qlt_zip_url_pre_2024,
-        2022: get_qlt_zip_url_pre_2024,
-        2023: get_qlt_zip_url_pre_2024,
-        2024: get_qlt_zip_url_from_2024
-    }  
-
-    for year, format_func in year_format_mapping.items():
-        url = format_func(year) # get the download URL
-        zip_name = url.rsplit("/", 1)[-1] # get the last part of the url
-
-        print(f"Downloading {zip_name}.")
-        r = requests.get(url)
-        if r.status_code != 200:
-            raise Exception(f"Failed to download {zip_name}. Error: {r.status_code}")
-        
-        print(f"Extracting {zip_name}.")
-        z = zipfile.ZipFile(io.BytesIO(r.content))
-        # error if all files within the zip file are not also zip files
-        if not all([f.filename.endswith(".zip") for f in z.filelist]):
-            raise Exception(f"Unexpected contents of {zip_name}.")
-        # iterate through file list of the parent zip file and extract the nested zips
-        for f in z.filelist:
-            nested_zip_file = z.open(f)
-            nested_zip = zipfile.ZipFile(nested_zip_file)
-            nested_zip.extractall(args.output_dir)
-            nested_zip.close()
-            nested_zip_file.close()
+    # create the output directory up front so the download threads don't race on it
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    # load the cache validators of previous downloads
+    http_cache_path = os.path.join(args.output_dir, HTTP_CACHE_FILE_NAME)
+    try:
+        with open(http_cache_path) as f:
+            http_cache = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        http_cache = {}
+
+    # reuse a single connection pool so the TLS handshake is only paid once
+    with requests.Session() as s:
+        s.mount(
+            "https://",
+            HTTPAdapter(
+                pool_connections=2,
+                pool_maxsize=4,
+                max_retries=Retry(total=3, backoff_factor=0.5),
+            ),
+        )
+        # the archives are already compressed, so ask for them as-is rather
+        # than have them gzipped in transit and decompressed again by urllib3
+        s.headers.update(
+            {"Accept-Encoding": "identity", "User-Agent": "ch-paystub-verify/1.0"}
+        )
+        # the downloads are network-bound, so fetch all years concurrently
+        with ThreadPoolExecutor(max_workers=4) as ex:
+            futures = {
+                url: ex.submit(fetch, url, s, args.output_dir, http_cache.get(url))
+                for url in YEAR_TO_URL.values()
+            }
+
+    # keep the cache entries of the years that succeeded even if another year
+    # failed, so that they aren't downloaded again on the next run
+    # (the entries of failed years are dropped, as their files may be incomplete)
+    new_http_cache = {}
+    error = None
+    for url, future in futures.items():
+        try:
+            new_http_cache[url] = future.result()
+        except Exception as e:
+            error = error or e
+    with open(http_cache_path, "w") as f:
+        json.dump(new_http_cache, f, indent=4)
+    if error:
+        raise error
 
 if __name__ == "__main__":
     main()
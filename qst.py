@@ -1,30 +1,77 @@
-from decimal import Decimal
+import bisect
+import functools
+import mmap
+import pickle
+import re
+import struct
+from dataclasses import dataclass
+from decimal import Decimal, ROUND_HALF_UP
 from pathlib import Path
+from typing import Iterable
 
 QST_RECORD_TYPE_VORLAUF = "00"
 QST_RECORD_TYPE_PROGRESSIVE_QUELLENSTEUERTARIFE = "06"
 
+ONE = Decimal(1)
+ROUND_05_STEP = Decimal("0.05")
+
+# QST-codes supported by this tool (see explain_qst_code), e.g. A0N
+_QST_CODE_RE = re.compile(r"[A-Z]\d[NY]")
+
+# version of the pickled tax table cache format, which must be incremented
+# whenever QSTBracket or the parsing in _iter_brackets changes
+_CACHE_VERSION = 1
+
 
 def round_05(num: Decimal) -> Decimal:
-    to = Decimal("0.05")
-    # todo: fix this hack to round 0.xx5 up rather than down
-    return Decimal(round((num + Decimal(0.0001)) / to) * to)
+    # round half up to the nearest multiple of 0.05
+    return (num * 20).quantize(ONE, rounding=ROUND_HALF_UP) * ROUND_05_STEP
 
 
 class QSTRecord:
-    def __init__(self, row: str, format, record_type: str):
-        # parse the ASCII row into a dictionary
-        # mapping is a dict with the format {field_name: (index_start, index_end)}
-        self.format = format
-        self.data = {}
-        for field_name, (index_start, index_end) in format.items():
+    # fields are stored in slots rather than a per-record dict
+    __slots__ = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # precompile the subclass' _format into a layout of (slot_name, slice) pairs
+        # _format is a dict {field_name: (slot_name, index_start, index_end)}
+        cls._layout = tuple(
+            (slot_name, slice(index_start - 1, index_end))
+            for slot_name, index_start, index_end in cls._format.values()
+        )
+        # the slice of each raw field by field name
+        cls._field_slices = {
+            field_name: field_slice
+            for field_name, (_, field_slice) in zip(cls._format, cls._layout)
+        }
+        # a struct unpacking a (bytes) row into its fields in the order of _format,
+        # and the index of each field within the unpacked tuple by field name
+        struct_format = ""
+        position = 1
+        for _, index_start, index_end in cls._format.values():
+            if index_start > position:
+                # skip any gap between fields
+                struct_format += f"{index_start - position}x"
+            struct_format += f"{index_end - index_start + 1}s"
+            position = index_end + 1
+        cls._struct = struct.Struct(struct_format)
+        cls._field_indices = {
+            field_name: index for index, field_name in enumerate(cls._format)
+        }
+
+    def __init__(self, row: str, layout, record_type: str):
+        # parse the ASCII row into the record's slots
+        # every record type starts with its two-character "Recordart",
+        # so reject rows of other types before parsing any fields
+        if row[self._field_slices["Recordart"]] != record_type:
+            raise TypeError()
+        for slot_name, field_slice in layout:
             # remove all leading/trailing whitespace
-            self.data[field_name] = row[index_start - 1 : index_end].strip()
-            if self.data["Recordart"] != record_type:
-                raise TypeError()
+            setattr(self, slot_name, row[field_slice].strip())
 
     def __str__(self):
-        return self.data.__str__()
+        return {slot: getattr(self, slot) for slot in self.__slots__}.__str__()
 
 
 # 3.2. Vorlaufrecord (Recordart 00)
@@ -32,24 +79,26 @@ class QSTRecord:
 # 00BE···············20211125···················································································
 # Vorlaufrecord, Kanton Bern, erstellt am 25.11.2021
 class QSTVorlaufrecord(QSTRecord):
-    __format = {
-        "Recordart": (1, 2),
-        "Kanton": (3, 4),
-        "SSL Nummer": (5, 19),
-        "Erstellungsdatum": (20, 27),
-        "Textzeile 1": (28, 67),
-        "Textzeile 2": (68, 107),
-        "Code Status": (108, 110),
+    # {field_name: (slot_name, index_start, index_end)} as in the specification
+    _format = {
+        "Recordart": ("recordart", 1, 2),
+        "Kanton": ("kanton", 3, 4),
+        "SSL Nummer": ("ssl_nummer", 5, 19),
+        "Erstellungsdatum": ("erstellungsdatum", 20, 27),
+        "Textzeile 1": ("textzeile_1", 28, 67),
+        "Textzeile 2": ("textzeile_2", 68, 107),
+        "Code Status": ("code_status", 108, 110),
     }
+    __slots__ = tuple(slot for slot, _, _ in _format.values())
 
     def __init__(self, row):
-        super().__init__(row, self.__format, QST_RECORD_TYPE_VORLAUF)
+        super().__init__(row, self._layout, QST_RECORD_TYPE_VORLAUF)
 
     def get_canton_code(self):
-        return self.data["Kanton"]
+        return self.kanton
 
     def get_issue_date(self):
-        return self.data["Erstellungsdatum"]
+        return self.erstellungsdatum
 
 
 # 3.3. Progressive Quellensteuertarife (Recordart 06)
@@ -59,47 +108,60 @@ class QSTVorlaufrecord(QSTRecord):
 # Kirchensteuer, Tarif gültig ab 01.01.2022, steuerbares Einkommen ab Fr. 6‘501, Tarifschritt
 # Fr. 50.00, 2 Kinder, Steuerbetrag Fr. 0.00 (keine Mindeststeuer), Steuer %-Satz 7,15
 class QSTProgressiveQuellensteuertarifeRecord(QSTRecord):
-    __format = {
-        "Recordart": (1, 2),
-        "Transaktionsart": (3, 4),
-        "Kanton": (5, 6),
-        "QSt-Code": (7, 16),
-        "Datum gültig ab": (17, 24),
-        "Steuerbares Einkommen ab": (25, 33),
-        "Tarifschritt": (34, 42),
-        "Code Geschlecht": (43, 43),
-        "Anzahl Kinder": (44, 45),
-        "Mindeststeuer": (46, 54),
-        "Steuer %-Satz": (55, 59),
-        "Code Status": (60, 62),
+    # {field_name: (slot_name, index_start, index_end)} as in the specification
+    _format = {
+        "Recordart": ("recordart", 1, 2),
+        "Transaktionsart": ("transaktionsart", 3, 4),
+        "Kanton": ("kanton", 5, 6),
+        "QSt-Code": ("tarifcode", 7, 16),
+        "Datum gültig ab": ("datum_gueltig_ab", 17, 24),
+        "Steuerbares Einkommen ab": ("einkommen_ab", 25, 33),
+        "Tarifschritt": ("tarifschritt", 34, 42),
+        "Code Geschlecht": ("geschlecht", 43, 43),
+        "Anzahl Kinder": ("kinder", 44, 45),
+        "Mindeststeuer": ("mindeststeuer", 46, 54),
+        "Steuer %-Satz": ("satz", 55, 59),
+        "Code Status": ("code_status", 60, 62),
     }
+    __slots__ = tuple(slot for slot, _, _ in _format.values())
 
     def __init__(self, row):
         super().__init__(
-            row, self.__format, QST_RECORD_TYPE_PROGRESSIVE_QUELLENSTEUERTARIFE
+            row, self._layout, QST_RECORD_TYPE_PROGRESSIVE_QUELLENSTEUERTARIFE
         )
 
     # Steuer %-Satz
     def tax_rate(self) -> Decimal:
-        return Decimal(self.data["Steuer %-Satz"]) / Decimal(10000)
+        return Decimal(self.satz) / Decimal(10000)
 
     # Income threshhold
     def income_threshhold(self) -> Decimal:
-        return Decimal(self.data["Steuerbares Einkommen ab"]) / Decimal(100)
+        return Decimal(self.einkommen_ab) / Decimal(100)
 
     # Minimum tax
     def minimum_tax(self) -> Decimal:
-        return Decimal(self.data["Mindeststeuer"]) / Decimal(100)
+        return Decimal(self.mindeststeuer) / Decimal(100)
 
     # Tariff progression step
     def tariff_step(self) -> Decimal:
-        return Decimal(self.data["Tarifschritt"]) / Decimal(100)
+        return Decimal(self.tarifschritt) / Decimal(100)
 
     # QST-Code
     def qst_code(self) -> str:
-        return self.data["QSt-Code"]
+        return self.tarifcode
 
 
+# A tax bracket in the fixed-point units of the tariff file, so that the
+# tax calculation only needs integer arithmetic
+@dataclass(frozen=True)
+class QSTBracket:
+    income_threshhold: int  # cents
+    tariff_step: int  # cents
+    minimum_tax: int  # cents
+    tax_rate: int  # 1/10000 (i.e. hundredths of a percent)
+
+
+@functools.cache
 def explain_qst_code(code: str):
     part1 = {
         "A": "Single",
@@ -112,7 +174,11 @@ def explain_qst_code(code: str):
     return f"{part1[code[0]]}, Children: {code[1]}, {part3[code[2]]}"
 
 
+@functools.cache
 def is_qst_code_supported(code: str):
+    # explain_qst_code only looks at the first three characters
+    if not _QST_CODE_RE.fullmatch(code):
+        return False
     try:
         explain_qst_code(code)
         return True
@@ -120,17 +186,29 @@ def is_qst_code_supported(code: str):
         return False
 
 
-def get_qst_records(data: list, code: str) -> list:
-    records = []
-    for row in data:
-        try:
-            record = QSTProgressiveQuellensteuertarifeRecord(row)
-            if record.qst_code() == code:
-                records.append(record)
-        except TypeError:
-            # `row` not a QSTProgressiveQuellensteuertarifeRecord, so skip it
-            pass
-    return records
+def _is_matching_row(row, record_type, qst_code) -> bool:
+    # filter on the raw "Recordart" and "QSt-Code" columns so that only the
+    # matching rows are parsed; works on str and bytes rows alike, given a
+    # `record_type` and `qst_code` of the same type as the row
+    field_slices = QSTProgressiveQuellensteuertarifeRecord._field_slices
+    return (
+        row[field_slices["Recordart"]] == record_type
+        and row[field_slices["QSt-Code"]].strip() == qst_code
+    )
+
+
+# Returns the full Progressive Quellensteuertarife records of a QST-code, e.g. to
+# inspect a tax table. The tax calculation doesn't use these records but the
+# fixed-point brackets of `_load_records`, and this function is kept for API
+# compatibility.
+# `data` may be any iterable of rows, e.g. an open tax table file, so that the
+# rows don't have to be read into a list first
+def get_qst_records(data: Iterable[str], code: str) -> list:
+    return [
+        QSTProgressiveQuellensteuertarifeRecord(row)
+        for row in data
+        if _is_matching_row(row, QST_RECORD_TYPE_PROGRESSIVE_QUELLENSTEUERTARIFE, code)
+    ]
 
 
 def get_qst_code(
@@ -153,21 +231,114 @@ def get_qst_code(
 # https://www.swissdec.ch/de/releases-und-updates/richtlinien-elm/
 # Anhang 1 Beispiele QST-Berechnung 20200220_20201202
 #
-def calculate_withholding_tax_from_table(qst_table: list, income: Decimal) -> Decimal:
-    def is_income_in_range(record, income):
-        bracket_min = record.income_threshhold()
-        bracket_max = bracket_min + record.tariff_step()
-        return bracket_min <= income and bracket_max >= income
-
-    record = next(r for r in qst_table if is_income_in_range(r, income))
-    tax = round_05(max(record.tax_rate() * income, record.minimum_tax()))
-    return tax
+# `qst_table` is a (thresholds, brackets) tuple as returned by `_load_records`,
+# with the brackets sorted by their income threshhold.
+#
+def calculate_withholding_tax_from_table(qst_table: tuple, income: Decimal) -> Decimal:
+    thresholds, brackets = qst_table
+    income_cents = int(income * 100)
+    # as the upper bound of a bracket is inclusive, an income on a boundary
+    # belongs to the lower bracket, so the candidates are the brackets starting
+    # at the last threshold below the income up to those starting at the income
+    # (this keeps the first-match semantics of a linear scan over the sorted
+    # brackets, as long as no bracket reaches past the next threshold)
+    start = bisect.bisect_left(thresholds, income_cents)
+    if start > 0:
+        start = bisect.bisect_left(thresholds, thresholds[start - 1])
+    end = bisect.bisect_right(thresholds, income_cents)
+    index = next(
+        (
+            i
+            for i in range(start, end)
+            if income_cents <= thresholds[i] + brackets[i].tariff_step
+        ),
+        None,
+    )
+    if index is None:
+        raise ValueError(f"No tax bracket found for an income of {income}.")
+    bracket = brackets[index]
+    # the tax in units of 1/10000 cents, rounded half up to the nearest 0.05
+    tax = max(income_cents * bracket.tax_rate, bracket.minimum_tax * 10000)
+    tax_cents = (tax + 25000) // 50000 * 5
+    return Decimal(tax_cents).scaleb(-2)
 
 
 def has_annual_qst_model(canton_code: str) -> bool:
     return canton_code in ["FR", "GE", "TI", "VD", "VS"]
 
 
+def _iter_brackets(path: Path, qst_code: str):
+    # yields the brackets of the matching rows in a single pass over the tax table
+    record_type = QST_RECORD_TYPE_PROGRESSIVE_QUELLENSTEUERTARIFE.encode("ascii")
+    code = qst_code.encode("ascii")
+    record_struct = QSTProgressiveQuellensteuertarifeRecord._struct
+    # indices of the bracket's fields within the unpacked row
+    field_indices = QSTProgressiveQuellensteuertarifeRecord._field_indices
+    income_threshhold, tariff_step, minimum_tax, tax_rate = (
+        field_indices[field_name]
+        for field_name in (
+            "Steuerbares Einkommen ab",
+            "Tarifschritt",
+            "Mindeststeuer",
+            "Steuer %-Satz",
+        )
+    )
+    # map the tax table into memory and read it as bytes
+    # (the tariff fields are ASCII, so the rows never need to be decoded)
+    with open(path, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        for row in iter(mm.readline, b""):
+            # only unpack the relevant rows
+            if not _is_matching_row(row, record_type, code):
+                continue
+            row = row.rstrip(b"\r\n").ljust(record_struct.size)
+            fields = record_struct.unpack_from(row)
+            yield QSTBracket(
+                int(fields[income_threshhold]),
+                int(fields[tariff_step]),
+                int(fields[minimum_tax]),
+                int(fields[tax_rate]),
+            )
+
+
+def _parse_records(path: Path, qst_code: str) -> tuple:
+    brackets = sorted(
+        _iter_brackets(path, qst_code), key=lambda b: b.income_threshhold
+    )
+    thresholds = tuple(b.income_threshhold for b in brackets)
+    return thresholds, tuple(brackets)
+
+
+# the tax tables are static, so parse each (year, canton, code) table only once
+# per process, and keep the parsed table in a pickle next to the tax table
+# (e.g. qst/tar24zh.A0N.v1.pkl) to skip parsing on subsequent runs
+# returns a (thresholds, brackets) tuple sorted by income threshhold for bisection
+@functools.lru_cache(maxsize=256)
+def _load_records(year: int, canton_code: str, qst_code: str) -> tuple:
+    # the QST-code is part of the cache file name, so reject anything else
+    if not _QST_CODE_RE.fullmatch(qst_code):
+        raise ValueError(f"Invalid QST-code: {qst_code}")
+    path = Path(__file__).parent / "qst" / f"tar{year-2000}{canton_code.lower()}.txt"
+    cache_path = path.with_name(f"{path.stem}.{qst_code}.v{_CACHE_VERSION}.pkl")
+    try:
+        if cache_path.stat().st_mtime >= path.stat().st_mtime:
+            with cache_path.open("rb") as f:
+                return pickle.load(f)
+    except Exception:
+        # missing or unreadable cache (unpickling can raise almost anything),
+        # so parse the tax table instead
+        pass
+    table = _parse_records(path, qst_code)
+    try:
+        with cache_path.open("wb") as f:
+            pickle.dump(table, f, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError:
+        # the cache is optional, e.g. if the tax table directory is read-only
+        pass
+    return table
+
+
 def calculate_withholding_tax(
     year: int,
     canton_code: str,
@@ -179,12 +350,7 @@ def calculate_withholding_tax(
         # the annual QST model requires cumulative calculations over the year
         raise ValueError("Annual QST models are not supported by this tool.")
     else:
-        # open and read the relevant tax table
-        with open(
-            f"{Path(__file__).parent}/qst/tar{year-2000}{canton_code.lower()}.txt"
-        ) as f:
-            data = f.read().splitlines()
-            # get the relevant records
-            records = get_qst_records(data, qst_code)
-            # calculate withholding tax
-            return calculate_withholding_tax_from_table(records, income)
+        # get the relevant records
+        records = _load_records(year, canton_code, qst_code)
+        # calculate withholding tax
+        return calculate_withholding_tax_from_table(records, income)
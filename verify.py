@@ -3,53 +3,170 @@ import datetime
 import itertools
 import qst
 import re
-import tabula
+import sys
 from typing import Tuple
 from dataclasses import dataclass
 from pathlib import Path
-from PyPDF2 import PdfReader
-from decimal import Decimal
+from decimal import Decimal, ROUND_HALF_UP
+
+# --- Precompiled regexes ---
+# all regexes of this module are compiled here once at import time, and used
+# through these constants rather than the re module functions; patterns for
+# parsing new payslip formats should be added here as well
+
+# payslip date, e.g. 31.01.2023
+_DATE_RE = re.compile(r"\d{2}[.\-]\d{2}[.\-]\d{4}")
+
+# withholding tax subtotal row, e.g. January 2022 / 30 SI-Days / ZH / A0N
+# groups: SI-days, canton code, QST-code
+_SUBTOTAL_RE = re.compile(
+    r".*?/\s*(\d+)\s+SI-Days\s*/\s*([A-Za-z]+)\s*/\s*([^/\s]+)\s*$"
+)
+
+# --- end of precompiled regexes ---
 
 CRED = "\033[91m"
 CGRN = "\033[92m"
 CYLW = "\033[93m"
 CEND = "\033[0m"
 
+# shared Decimal constants, so that they aren't constructed on every call
+TWO = Decimal(2)
+TWELVE = Decimal(12)
+
+
+# the contributions are calculated in integer cents, which is exact as payslip
+# amounts are exact to the cent, and only converted to Decimal at the boundary
+def _to_cents(amount: Decimal) -> int:
+    # any fraction of a cent is rounded half up
+    return int(amount.scaleb(2).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def _from_cents(cents: int) -> Decimal:
+    return Decimal(cents).scaleb(-2)
+
 
-def round_05(num: Decimal) -> Decimal:
-    to = Decimal("0.05")
-    # TODO: fix this calc
-    return Decimal(round((num + Decimal(0.0001)) / to) * to)
+def _round_05_cents(numerator: int, denominator: int = 1) -> int:
+    # round numerator / denominator cents half up (i.e. away from zero) to the
+    # nearest multiple of 5 cents, as qst.round_05 does
+    rounded = (abs(numerator) * 2 + denominator * 5) // (denominator * 10) * 5
+    return rounded if numerator >= 0 else -rounded
+
+
+# replacements turning a formatted payslip amount into a Decimal string
+DECIMAL_REPLACEMENT_PAIRS = [
+    ("'", ""),
+    ("%", ""),
+    (" ", ""),
+    (",", "."),
+]
 
 
 def str_to_dec(s: str) -> Decimal:
-    replacement_pairs = [
-        ("'", ""),
-        ("%", ""),
-        (" ", ""),
-        (",", "."),
-    ]
-
-    for pair in replacement_pairs:
+    for pair in DECIMAL_REPLACEMENT_PAIRS:
         s = s.replace(pair[0], pair[1])
 
     return Decimal(s.strip())
 
 
+PASS_PREFIX = CGRN + "PASS: "
+FAIL_PREFIX = CRED + "FAIL: "
+WARN_PREFIX = CYLW + "WARN: "
+NOTE_PREFIX = "NOTE: "
+COLOR_EOL = CEND + "\n"
+
+
+# note: sys.stdout is looked up on every call so that redirection keeps working
 def print_pass(msg: str):
-    print(CGRN + "PASS: " + msg + CEND)
+    sys.stdout.write(PASS_PREFIX + msg + COLOR_EOL)
 
 
 def print_fail(msg: str):
-    print(CRED + "FAIL: " + msg + CEND)
+    sys.stdout.write(FAIL_PREFIX + msg + COLOR_EOL)
 
 
 def print_warn(msg: str):
-    print(CYLW + "WARN: " + msg + CEND)
+    sys.stdout.write(WARN_PREFIX + msg + COLOR_EOL)
 
 
 def print_note(msg: str):
-    print("NOTE: " + msg)
+    sys.stdout.write(NOTE_PREFIX + msg + "\n")
+
+
+# contribution rates are stored as integers in units of 1/RATE_SCALE
+# (i.e. thousandths of a percent), so that 5300 is a rate of 5.3%
+RATE_SCALE = 100000
+
+# OASI (AHV+IV+EO) employee contribution rates by year
+OASI_RATES = {
+    2020: 5275,
+    2021: 5300,
+    2022: 5300,
+    2023: 5300,
+    2024: 5300,
+}
+# the same rates as Decimals, as returned by get_oasi_rate
+OASI_DECIMAL_RATES = {
+    year: Decimal(rate) / RATE_SCALE for year, rate in OASI_RATES.items()
+}
+
+# minimum salaries for BVG (second pillar pension) contributions by year
+BVG_MINIMUM_SALARIES = {
+    2020: Decimal("21330"),
+    2021: Decimal("21510"),
+    2022: Decimal("21510"),
+    2023: Decimal("22050"),
+    2024: Decimal("22050"),
+}
+BVG_MONTHLY_MINIMUM_SALARIES = {
+    year: salary / TWELVE for year, salary in BVG_MINIMUM_SALARIES.items()
+}
+
+# total BVG (second pillar pension) savings contribution rates by the minimum
+# age at the end of the year of each age band, in descending order of age
+BVG_RATES = {
+    55: 18000,
+    45: 15000,
+    35: 10000,
+    25: 7000,
+    0: 0,
+}
+BVG_DECIMAL_RATES = {
+    min_age: Decimal(rate) / RATE_SCALE for min_age, rate in BVG_RATES.items()
+}
+
+# AHV coordination deductions (Koordinationsabzug) by year
+AHV_COORDINATION_DEDUCTIONS = {
+    2020: Decimal("24885"),
+    2021: Decimal("25095"),
+    2022: Decimal("25095"),
+    2023: Decimal("25725"),
+    2024: Decimal("25725"),
+}
+
+# maximum insured salary for BVG (2nd pillar pension) and UI contributions
+MAX_INSURED_SALARY = Decimal(148200)
+MAX_MONTHLY_INSURED_SALARY = MAX_INSURED_SALARY / TWELVE
+
+UI_RATE = 1100
+UI_DECIMAL_RATE = Decimal(UI_RATE) / RATE_SCALE
+# solidarity rate on the part of the salary above the maximum insured salary
+SUI_RATE = 500
+
+# social security withholding rates on stock awards by year
+STOCK_AWARD_WITHHOLDING_RATES = {
+    2020: Decimal("0.0623"),  # unconfirmed
+    2021: Decimal("0.0623"),  # unconfirmed
+    2022: Decimal("0.0623"),  # confirmed
+    2023: Decimal("0.0630"),  # confirmed
+    2024: Decimal("0.0630"),  # unconfirmed
+}
+# Shares Withheld is rounded to the nearest thousandth of a share:
+# Shares Withheld = round(Shares Awarded * Withholding Rate, 3)
+# Withheld Value = (Shares Withheld * Share FMV * FX-Rate)
+# Therefore, allow tolerance of the value of a thousandth of a share
+# assuming a max share value price 1000 CHF ($MSFT=~290 CHF 01.05.2023)
+STOCK_AWARD_WITHHOLDING_TOLERANCE = Decimal("1")
 
 
 def get_oasi_rate(year: int) -> Decimal:
@@ -57,14 +174,7 @@ def get_oasi_rate(year: int) -> Decimal:
     Returns the OASI (AHV+IV+EO) employee contribution rate for a given year.
     The total rate contributed is double the rate returned (employee + employer).
     """
-    OASI_rates = {
-        2020: Decimal("0.05275"),
-        2021: Decimal("0.05300"),
-        2022: Decimal("0.05300"),
-        2023: Decimal("0.05300"),
-        2024: Decimal("0.05300"),
-    }
-    return OASI_rates[year]
+    return OASI_DECIMAL_RATES[year]
 
 
 def get_oasi_contribution(year: int, gross_salary: Decimal) -> Decimal:
@@ -72,39 +182,32 @@ def get_oasi_contribution(year: int, gross_salary: Decimal) -> Decimal:
     Returns the OASI (AHV+IV+EO) employee contribution for a given year and gross salary.
     The total sum contributed is double the sum returned (employee + employer).
     """
-    return round_05(gross_salary * get_oasi_rate(year))
+    return _from_cents(
+        _round_05_cents(_to_cents(gross_salary) * OASI_RATES[year], RATE_SCALE)
+    )
 
 
 def get_bvg_minimum_salary(year: int) -> Decimal:
     """
     Returns the minimum salary for BVG (second pillar pension) contributions for a given year.
     """
-    BVG_minimum_salaries = {
-        2020: Decimal("21330"),
-        2021: Decimal("21510"),
-        2022: Decimal("21510"),
-        2023: Decimal("22050"),
-        2024: Decimal("22050"),
-    }
-    return BVG_minimum_salaries[year]
+    return BVG_MINIMUM_SALARIES[year]
 
 
 def get_bvg_monthly_minimum_salary(year: int) -> Decimal:
-    return get_bvg_minimum_salary(year) / Decimal(12)
+    return BVG_MONTHLY_MINIMUM_SALARIES[year]
 
 
 def get_ahv_coordination_deduction(year: int) -> Decimal:
     """
     Returns the AHV coordination deduction (Koordinationsabzug) for a given year.
     """
-    AHV_coordination_deductions = {
-        2020: Decimal("24885"),
-        2021: Decimal("25095"),
-        2022: Decimal("25095"),
-        2023: Decimal("25725"),
-        2024: Decimal("25725"),
-    }
-    return AHV_coordination_deductions[year]
+    return AHV_COORDINATION_DEDUCTIONS[year]
+
+
+def _get_bvg_age_band(age_at_eoy: int) -> int:
+    # the minimum age of the BVG rate band that an age at the end of the year is in
+    return next((min_age for min_age in BVG_RATES if age_at_eoy >= min_age), 0)
 
 
 def get_bvg_rate(age_at_eoy: int) -> Decimal:
@@ -112,16 +215,24 @@ def get_bvg_rate(age_at_eoy: int) -> Decimal:
     Returns the total BVG (second pillar pension) contribution rate given an age at the end of the year.
     The rate returned is the sum of the employee and employer rates (split 50/50).
     """
-    if age_at_eoy < 25:
-        return Decimal("0")
-    elif age_at_eoy < 35:
-        return Decimal("0.07")
-    elif age_at_eoy < 45:
-        return Decimal("0.10")
-    elif age_at_eoy < 55:
-        return Decimal("0.15")
-    else:
-        return Decimal("0.18")
+    return BVG_DECIMAL_RATES[_get_bvg_age_band(age_at_eoy)]
+
+
+def _get_bvg_savings_contribution_cents(
+    year: int, age_at_eoy: int, annual_base_salary: Decimal
+) -> int:
+    if annual_base_salary < get_bvg_minimum_salary(year):
+        return 0
+    annual_base_salary_cents = _to_cents(annual_base_salary)
+    ahv_coordination_deduction = _to_cents(get_ahv_coordination_deduction(year))
+    insured_salary1 = annual_base_salary_cents - ahv_coordination_deduction
+    insured_salary2 = (
+        min(annual_base_salary_cents, 300000 * 100) - 3 * ahv_coordination_deduction
+        if age_at_eoy >= 35
+        else 0
+    )
+    rate = BVG_RATES[_get_bvg_age_band(age_at_eoy)]
+    return _round_05_cents((insured_salary1 + insured_salary2) * rate, RATE_SCALE)
 
 
 def get_bvg_savings_contribution(
@@ -131,26 +242,19 @@ def get_bvg_savings_contribution(
     Returns the BVG (2nd pillar pension) savings contribution for a year, age at the end of that year, and base salary.
     The sum returned is the sum of the employee and employer contributions (split 50/50).
     """
-    if annual_base_salary < get_bvg_minimum_salary(year):
-        return Decimal(0)
-    ahv_coordination_deduction = get_ahv_coordination_deduction(year)
-    insured_salary1 = annual_base_salary - ahv_coordination_deduction
-    insured_salary2 = (
-        min(annual_base_salary, Decimal(300000))
-        - (Decimal(3) * ahv_coordination_deduction)
-        if age_at_eoy >= 35
-        else Decimal(0)
+    return _from_cents(
+        _get_bvg_savings_contribution_cents(year, age_at_eoy, annual_base_salary)
     )
-    rate = get_bvg_rate(age_at_eoy)
-    bvg_savings_contribution = round_05((insured_salary1 + insured_salary2) * rate)
-    return bvg_savings_contribution
 
 
 def get_bvg_monthly_savings_contribution(
     year: int, age_at_eoy: int, annual_base_salary: Decimal
 ) -> Decimal:
-    return round_05(
-        get_bvg_savings_contribution(year, age_at_eoy, annual_base_salary) / Decimal(12)
+    return _from_cents(
+        _round_05_cents(
+            _get_bvg_savings_contribution_cents(year, age_at_eoy, annual_base_salary),
+            12,
+        )
     )
 
 
@@ -159,19 +263,20 @@ def get_max_insured_salary(year: int) -> Decimal:
     Returns the maximum insured salary for BVG (2nd pillar pension) contributions for a given year.
     """
     del year  # unused for now but kept for future support
-    return Decimal(148200)
+    return MAX_INSURED_SALARY
 
 
 def get_max_monthly_insured_salary(year: int) -> Decimal:
     """
     Returns the maximum monthly insured salary for BVG (2nd pillar pension) contributions for a given year.
     """
-    return get_max_insured_salary(year) / Decimal(12)
+    del year  # unused for now but kept for future support
+    return MAX_MONTHLY_INSURED_SALARY
 
 
 def get_ui_rate(year: int) -> Decimal:
     del year  # unused for now but kept for future support
-    return Decimal("0.011")
+    return UI_DECIMAL_RATE
 
 
 def get_ui_contribution(year: int, gross_salary_si: Decimal) -> Decimal:
@@ -179,8 +284,10 @@ def get_ui_contribution(year: int, gross_salary_si: Decimal) -> Decimal:
     Returns the UI (ALV) contribution for a given year and gross salary.
     The total sum contributed is double the sum returned (employee + employer).
     """
-    insured_salary = min(gross_salary_si, get_max_monthly_insured_salary(year))
-    return round_05(insured_salary * get_ui_rate(year))
+    insured_salary = min(
+        _to_cents(gross_salary_si), _to_cents(get_max_monthly_insured_salary(year))
+    )
+    return _from_cents(_round_05_cents(insured_salary * UI_RATE, RATE_SCALE))
 
 
 def get_sui_contribution(year: int, gross_salary_si: Decimal) -> Decimal:
@@ -190,8 +297,10 @@ def get_sui_contribution(year: int, gross_salary_si: Decimal) -> Decimal:
     """
     if gross_salary_si <= get_max_monthly_insured_salary(year) or year > 2022:
         return Decimal(0)
-    applicable_salary = gross_salary_si - get_max_monthly_insured_salary(year)
-    return round_05(applicable_salary * Decimal(0.005))
+    applicable_salary = _to_cents(gross_salary_si) - _to_cents(
+        get_max_monthly_insured_salary(year)
+    )
+    return _from_cents(_round_05_cents(applicable_salary * SUI_RATE, RATE_SCALE))
 
 
 @dataclass
@@ -236,7 +345,7 @@ known_pension_deduction_entries: list[str] = [
 
 known_tax_deduction_entry = "Withholding tax deduction"  # Quellensteuer
 
-known_deduction_entries: list[str] = list(
+known_deduction_entries: frozenset[str] = frozenset(
     itertools.chain(
         known_social_deduction_entries,
         known_pension_deduction_entries,
@@ -245,32 +354,64 @@ known_deduction_entries: list[str] = list(
 )
 
 
+def read_payslip_date(payslip_path: str) -> datetime.date:
+    """
+    Reads the date of a payslip PDF from the text of its first page.
+    """
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(payslip_path)
+    raw_payslip_date = _DATE_RE.search(reader.pages[0].extract_text()).group(0)
+    return datetime.datetime.strptime(raw_payslip_date, "%d.%m.%Y").date()
+
+
+def read_payslip_dataframe(payslip_path: str):
+    """
+    Reads the payroll table of a payslip PDF, indexed by payroll type.
+    """
+    # imported here as importing tabula is slow, e.g. for --help or argument errors
+    import tabula
+
+    df = tabula.read_pdf(payslip_path, pages="all")[0]
+    # select the named columns rather than dropping the unnamed ones in place
+    # note: tabula passes `pandas_options` to pd.DataFrame rather than pd.read_csv
+    # when reading multiple tables, so `usecols` can't skip them while reading
+    columns = [c for c in df.columns if "Unnamed" not in c]
+    return df[columns].fillna(0).set_index("Payroll type")
+
+
+def read_payslip(payslip_path: str) -> Tuple[datetime.date, object]:
+    """
+    Reads a payslip PDF.
+    Returns a (date, df) tuple of its date and payroll table.
+    """
+    return read_payslip_date(payslip_path), read_payslip_dataframe(payslip_path)
+
+
+# marks a value missing from the Payslip.get_val cache
+_NOT_CACHED = object()
+
+
 class Payslip:
-    def __init__(self, payslip_path: str, employee: EmployeeData):
+    def __init__(
+        self, payslip_path: str, employee: EmployeeData, df=None, date=None
+    ):
+        # `df` and `date` may be provided if the payslip has already been read
         self.__payslip_path = payslip_path
         self.payslip_name = Path(payslip_path).name
-        self.payslip_date = self.__get_date()
-        self.df = self.__get_dataframe()
-        self.employee = employee
-
-    def __get_date(self):
-        reader = PdfReader(self.__payslip_path)
-        raw_payslip_date = re.search(
-            r"\d{2}(\.|-)\d{2}(\.|-)\d{4}", reader.pages[0].extract_text()
-        )[0]
-        return datetime.datetime.strptime(raw_payslip_date, "%d.%m.%Y").date()
-
-    def __get_dataframe(self):
-        df = tabula.read_pdf(self.__payslip_path, pages="all")[0]
-        columns_to_drop = [c for c in df.columns if "Unnamed" in c]
-        df.drop(
-            labels=columns_to_drop,
-            axis=1,
-            inplace=True,
+        self.payslip_date = (
+            date if date is not None else read_payslip_date(payslip_path)
         )
-        df.fillna(0, inplace=True)
-        df.set_index("Payroll type", inplace=True)
-        return df
+        self.df = df if df is not None else read_payslip_dataframe(payslip_path)
+        # the row labels as a list, as indexing a pandas Index is comparatively slow
+        self._index_list = self.df.index.tolist()
+        self._n = len(self._index_list)
+        # map each payroll type to the position of its (first) row
+        self._row_pos = {}
+        for position, row in enumerate(self._index_list):
+            self._row_pos.setdefault(row, position)
+        self._val_cache = {}
+        self.employee = employee
 
     def __str__(self):
         return self.df.to_string()
@@ -293,16 +434,24 @@ class Payslip:
     def get_val(
         self, row: str, col: str = "Total", throw_if_not_found=False
     ) -> Decimal:
-        try:
-            return str_to_dec(str(self.df.at[row, col]))
-        except KeyError as err:
+        # values are cached per (row, col), with None marking a missing row or column
+        key = (row, col)
+        val = self._val_cache.get(key, _NOT_CACHED)
+        if val is _NOT_CACHED:
+            try:
+                val = str_to_dec(str(self.df.at[row, col]))
+            except KeyError:
+                val = None
+            self._val_cache[key] = val
+        if val is None:
             if throw_if_not_found:
-                raise (err)
+                raise KeyError(key)
             else:
                 return Decimal(0)
+        return val
 
     def row_exists(self, row: str) -> bool:
-        return row in self.df.index
+        return row in self._row_pos
 
     def val_exists(self, row: str, col: str, only_non_zero=False) -> bool:
         try:
@@ -321,27 +470,27 @@ class Payslip:
     ):
         # get the indices of the start and end rows
         start = (
-            (self.df.index.get_loc(start_row) + (0 if include_start else 1))
+            (self._row_pos[start_row] + (0 if include_start else 1))
             if start_row
             else 0
         )
         end = (
-            (self.df.index.get_loc(end_row) + (1 if include_end else 0))
+            (self._row_pos[end_row] + (1 if include_end else 0))
             if end_row
-            else len(self.df.index) - 1
+            else self._n - 1
         )
         # return a dataframe slice between the start and end rows
         return self.df.iloc[start:end]
 
     def get_subtotal_slice(self, total_row: str):
         def is_next_row_subtotal(row_index: str):
-            if row_index < len(self.df.index) - 1:
-                subsequent_row = self.df.index[row_index + 1]
+            if row_index < self._n - 1:
+                subsequent_row = self._index_list[row_index + 1]
                 return self.val_exists(subsequent_row, "Sub-total", only_non_zero=True)
             else:
                 return False
 
-        start_index = self.df.index.get_loc(total_row)
+        start_index = self._row_pos[total_row]
         if is_next_row_subtotal(start_index):
             start_index += 1
             end_index = start_index
@@ -353,17 +502,23 @@ class Payslip:
 
     @staticmethod
     def get_col_sum(section, col: str) -> Decimal:
-        # iterate through the column and sum the values
+        column = section[col]
+        # integer columns can be summed exactly by pandas
+        if column.dtype.kind in "iu":
+            return Decimal(int(column.sum()))
+        # otherwise clean the whole column at once and sum the values as decimals
         # note: don't use .sum as there is an internal float64 conversion
-        result = Decimal(0)
-        for x in section[col].tolist():
-            result += str_to_dec(str(x))
-        return result
+        cleaned = column.astype(str)
+        for pair in DECIMAL_REPLACEMENT_PAIRS:
+            cleaned = cleaned.str.replace(pair[0], pair[1], regex=False)
+        return sum(map(Decimal, cleaned.str.strip()), Decimal(0))
 
 
 class SupplementaryPayslip(Payslip):
-    def __init__(self, payslip_path: str, employee: EmployeeData):
-        super().__init__(payslip_path, employee)
+    def __init__(
+        self, payslip_path: str, employee: EmployeeData, df=None, date=None
+    ):
+        super().__init__(payslip_path, employee, df, date)
         if self.row_exists("Monthly wage"):
             raise ValueError(
                 "Supplementary payslip input contains a 'Monthly wage' row."
@@ -376,28 +531,16 @@ class SupplementaryPayslip(Payslip):
             )
 
     def validate_stock_withholding(self, stock_award: Decimal):
-        stock_award_withholding_rate_by_year = {
-            2020: Decimal(0.0623),  # unconfirmed
-            2021: Decimal(0.0623),  # unconfirmed
-            2022: Decimal(0.0623),  # confirmed
-            2023: Decimal(0.0630),  # confirmed
-            2024: Decimal(0.0630),  # unconfirmed
-        }
-        stock_award_withholding_rate = stock_award_withholding_rate_by_year[
+        stock_award_withholding_rate = STOCK_AWARD_WITHHOLDING_RATES[
             self.payslip_date.year
         ]
         stated_withholding = self.get_val("Already settled social security")
-        expected_withholding = round_05(stock_award * stock_award_withholding_rate)
+        expected_withholding = qst.round_05(stock_award * stock_award_withholding_rate)
         Payslip.validate_calc(
             "Stock award social security withholding",
             stated_withholding,
             expected_withholding,
-            # Shares Withheld is rounded to the nearest thousandth of a share:
-            # Shares Withheld = round(Shares Awarded * Withholding Rate, 3)
-            # Withheld Value = (Shares Withheld * Share FMV * FX-Rate)
-            # Therefore, allow tolerance of the value of a thousandth of a share
-            # assuming a max share value price 1000 CHF ($MSFT=~290 CHF 01.05.2023)
-            tolerance=Decimal(1.0),
+            tolerance=STOCK_AWARD_WITHHOLDING_TOLERANCE,
         )
 
     def validate(self):
@@ -413,8 +556,10 @@ class WagePayslip(Payslip):
         payslip_path: str,
         employee: EmployeeData,
         supplements: list[SupplementaryPayslip] = None,
+        df=None,
+        date=None,
     ):
-        super().__init__(payslip_path, employee)
+        super().__init__(payslip_path, employee, df, date)
         self.supplements = supplements
         # ensure that this payslip and its supplements all have the same date
         for supplement in supplements:
@@ -464,7 +609,7 @@ class WagePayslip(Payslip):
         # assume CHF and USD are 1:1 for this heuristic
         max_espp_contribution = Decimal(25000)
         # 10% discount = 11.1111% gain (assume CHF->USD = 1:1)
-        max_espp_gain = round_05(max_espp_contribution / Decimal(9))
+        max_espp_gain = qst.round_05(max_espp_contribution / Decimal(9))
         if espp_gain > max_espp_gain:
             self.validate_calc(
                 "ESPP gain exceeds maximum annual ESPP gain", espp_gain, max_espp_gain
@@ -487,13 +632,16 @@ class WagePayslip(Payslip):
             total_gross_salary_si += gross_salary_sum
             # validate the entries and adjust the social-insurance salary
             for entry in gross_salary_entries.index:
-                if entry not in known_gross_salary_entries:
+                component = known_gross_salary_entries.get(entry)
+                if component is None:
                     print_warn(f'Unknown gross salary component in payslip: "{entry}"')
-                else:
-                    if known_gross_salary_entries[entry].si_exempt:
-                        total_gross_salary_si -= payslip.get_val(entry)
-                    if known_gross_salary_entries[entry].external_payment:
-                        total_gross_salary_non_cash += payslip.get_val(entry)
+                    continue
+                if component.si_exempt or component.external_payment:
+                    value = payslip.get_val(entry)
+                    if component.si_exempt:
+                        total_gross_salary_si -= value
+                    if component.external_payment:
+                        total_gross_salary_non_cash += value
             # validate the payslip gross salary calculation
             Payslip.validate_calc(
                 f"Stated gross salary calculation [{payslip.payslip_name}]",
@@ -510,13 +658,13 @@ class WagePayslip(Payslip):
             print_warn("Expected base salary not specified as an argument.")
             print_warn(
                 f"Verify your annual salary (error up to 0.60): "
-                f"{stated_monthly_base_salary * Decimal(12)}"
+                f"{stated_monthly_base_salary * TWELVE}"
             )
         else:
             Payslip.validate_calc(
                 "Base salary",
                 stated_monthly_base_salary,
-                round_05(self.employee.base_salary / Decimal(12)),
+                qst.round_05(self.employee.base_salary / TWELVE),
             )
         return stated_monthly_base_salary
 
@@ -609,8 +757,15 @@ class WagePayslip(Payslip):
             )
 
     def validate_bvg_contributions(self, annual_base_salary: Decimal):
+        stated_bvg_contrib = sum(
+            (
+                self.get_aggregate_val_sum(pf_entry)
+                for pf_entry in known_pension_deduction_entries
+            ),
+            Decimal(0),
+        )
         if annual_base_salary < get_bvg_minimum_salary(self.payslip_date.year):
-            if self.get_aggregate_val_sum("PF/LOB contrib. fixed") != Decimal(0):
+            if stated_bvg_contrib != Decimal(0):
                 print_fail(
                     "Pension contribution found in payslip with salary below BVG minimum."
                 )
@@ -620,9 +775,6 @@ class WagePayslip(Payslip):
                 )
             return
 
-        stated_bvg_contrib = Decimal(0)
-        for pf_entry in known_pension_deduction_entries:
-            stated_bvg_contrib += self.get_aggregate_val_sum(pf_entry)
         specified_bvg_contrib = self.employee.pension_contribution
         if (
             specified_bvg_contrib
@@ -639,14 +791,14 @@ class WagePayslip(Payslip):
             employee_age_at_eoy = self.payslip_date.year - self.employee.birth_year
             computed_savings_contrib = -get_bvg_monthly_savings_contribution(
                 self.payslip_date.year, employee_age_at_eoy, annual_base_salary
-            ) / Decimal(2)
+            ) / TWO
             computed_savings_contrib_next_bracket = (
                 -get_bvg_monthly_savings_contribution(
                     self.payslip_date.year,
                     employee_age_at_eoy + 10,
                     annual_base_salary,
                 )
-                / Decimal(2)
+                / TWO
             )
             if stated_bvg_contrib >= computed_savings_contrib:
                 print_fail(
@@ -675,17 +827,15 @@ class WagePayslip(Payslip):
         if subtotal_df is None:
             print_fail("No subtotals found for withholding tax.")
             return
-        # TODO: update this heuristic with regex or something more reliable
-        if not str(subtotal_df.index[0]).find("SI-Days"):
+        # parse the relevant subtotal row name
+        # e.g. January 2022 / 30 SI-Days / ZH / A0N
+        subtotal_match = _SUBTOTAL_RE.match(str(subtotal_df.index[0]))
+        if not subtotal_match:
             print_fail(
                 "Unrecognized withholding tax subtotal format. Please report this issue."
             )
             return
-        # parse the relevant subtotal row name
-        # e.g. January 2022 / 30 SI-Days / ZH / A0N
-        subtotal_tokens = str(subtotal_df.index[0]).split("/")
-        canton_code = subtotal_tokens[2].strip()
-        qst_code = subtotal_tokens[3].strip()
+        si_days, canton_code, qst_code = subtotal_match.groups()
         # perform some basic validation
         if not qst.is_qst_code_supported(qst_code):
             print_warn(
@@ -696,7 +846,7 @@ class WagePayslip(Payslip):
             print_warn(
                 f"Canton {canton_code} has an annual withholding tax model. This check will likely erroneously fail."
             )
-        if not subtotal_tokens[1].strip() == "30 SI-Days":
+        if si_days != "30":
             print_warn(
                 f"Your payslip does not have 30 SI-Days. This check will likely erroneously fail."
             )
@@ -720,7 +870,7 @@ class WagePayslip(Payslip):
             stated_espp_contrib = self.get_val("ESPP")
             stated_espp_rate = self.get_val("ESPP", "Rate")
             applicable_salary = monthly_base_salary + self.get_val("Bonus")
-            expected_espp_contrib = -round_05(
+            expected_espp_contrib = -qst.round_05(
                 applicable_salary * (stated_espp_rate / Decimal(100))
             )
             Payslip.validate_calc(
@@ -738,15 +888,24 @@ class WagePayslip(Payslip):
         )
 
     def validate_balance_forward(self):
+        # sum the balance forward of all payslips and check whether any
+        # supplementary payslip has one in a single pass over the supplements
+        balance_forward = self.get_val("Balance forward")
+        balance_forward_aggregate_sum = balance_forward
+        supplement_has_balance_forward = False
+        for supplement in self.supplements:
+            supplement_balance_forward = supplement.get_val("Balance forward")
+            balance_forward_aggregate_sum += supplement_balance_forward
+            if supplement_balance_forward:
+                supplement_has_balance_forward = True
         # check if the aggregate sum of balance forward is not zero
-        balance_forward_aggregate_sum = self.get_aggregate_val_sum("Balance forward")
         if balance_forward_aggregate_sum != Decimal(0):
             print_fail(
                 f"Aggregate sum of balance forward is not zero: {balance_forward_aggregate_sum}"
             )
         # check for indicators of missing supplementary payslips
-        if self.get_val("Balance forward"):
-            if not any(other.get_val("Balance forward") for other in self.supplements):
+        if balance_forward:
+            if not supplement_has_balance_forward:
                 print_fail(
                     '"Balance forward" row found but no associated supplementary payslip specified.'
                 )
@@ -764,7 +923,7 @@ class WagePayslip(Payslip):
         annual_base_salary = (
             self.employee.base_salary
             if self.employee.base_salary
-            else monthly_base_salary * Decimal(12)
+            else monthly_base_salary * TWELVE
         )
 
         # validate supplementary payslips
@@ -841,14 +1000,24 @@ def main():
         args.base_salary,
         args.pension_contribution,
     )
+    # read all payslips up front, so that tabula reuses a single JVM for all
+    # of them (if JPype is installed)
+    # note: the reads are sequential, as tabula starts its JVM on the first read
+    # without any locking, and there are at most two payslips to overlap anyway
+    payslip_paths = [args.payslip_path]
+    if args.stock_payslip_path:
+        payslip_paths.append(args.stock_payslip_path)
+    payslips = {path: read_payslip(path) for path in payslip_paths}
     # parse stock payslip if one is provided
     # note: multiple supplementary payslips are supported but don't seem to occur in practice
-    supplements = (
-        [SupplementaryPayslip(args.stock_payslip_path, employee)]
-        if args.stock_payslip_path
-        else []
-    )
-    wage_payslip = WagePayslip(args.payslip_path, employee, supplements)
+    supplements = []
+    if args.stock_payslip_path:
+        date, df = payslips[args.stock_payslip_path]
+        supplements.append(
+            SupplementaryPayslip(args.stock_payslip_path, employee, df, date)
+        )
+    date, df = payslips[args.payslip_path]
+    wage_payslip = WagePayslip(args.payslip_path, employee, supplements, df, date)
     wage_payslip.validate()
 
 